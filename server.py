@@ -2,45 +2,117 @@
 """Async Python MCP server for Google Custom Search."""
 
 import argparse
+import asyncio
 import base64
 import binascii
-import json
+import functools
 import os
-from typing import Any
-
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from datetime import UTC, datetime, timedelta
+from types import MappingProxyType
+from typing import Annotated, Any, Literal
+
+import aiohttp
+import cachetools  # type: ignore[import-untyped]
+import google.auth.transport.requests
+import msgspec
+import orjson
+import requests  # type: ignore[import-untyped]
+import tenacity
 from fastmcp import FastMCP
 from google.oauth2 import service_account
-from googleapiclient.discovery import build  # type: ignore[import-untyped]
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, WithJsonSchema, field_validator
+from requests.adapters import HTTPAdapter  # type: ignore[import-untyped]
+from urllib3.util.retry import Retry
 
 # Initialize MCP server
 mcp = FastMCP("google-custom-search")
 
+# Custom Search JSON API endpoint
+CSE_ENDPOINT = "https://www.googleapis.com/customsearch/v1"
+
+# Google API max results per request
+MAX_RESULTS_PER_PAGE = 10
+
+# Shared read-only fallback for missing response sections
+_EMPTY: Mapping[str, Any] = MappingProxyType({})
+
+# Per-request timeout, short enough that retried timeouts bound tool latency
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=20, sock_connect=5)
+
+# Upper bound on concurrent requests to stay under the default API QPS quota
+MAX_CONCURRENT_REQUESTS = 10
+
+# Refresh the access token this long before it actually expires
+TOKEN_REFRESH_MARGIN = timedelta(seconds=60)
+
+# Search results are cached per (query, num_results)
+_CacheKey = tuple[str, int]
+
+# Bounds for the search results cache
+CACHE_MAX_SIZE = 1024
+CACHE_TTL_SECONDS = 3600
+
 
 class SearchParams(BaseModel):
     """Parameters for Google Custom Search."""
 
     query: str = Field(..., description="Search query")
-    num_results: int | None = Field(
+    # Published as nullable so clients may send null for the default
+    num_results: Annotated[
+        int,
+        WithJsonSchema(
+            {
+                "anyOf": [
+                    {"type": "integer", "minimum": 1, "maximum": 100},
+                    {"type": "null"},
+                ]
+            }
+        ),
+    ] = Field(
         default=10, ge=1, le=100, description="Number of results to return (1-100)"
     )
 
+    @field_validator("num_results", mode="before")
+    @classmethod
+    def default_num_results(cls, value: Any) -> Any:
+        """Treat an explicit null as the default number of results."""
+        return 10 if value is None else value
+
 
-class SearchResult(BaseModel):
+class SearchResult(msgspec.Struct, frozen=True):
     """Single search result from Google Custom Search."""
 
-    title: str = Field(..., description="Result title")
-    link: str = Field(..., description="Result URL")
-    snippet: str = Field(..., description="Result snippet")
-    display_link: str = Field(..., description="Display URL")
+    title: Annotated[str, msgspec.Meta(description="Result title")]
+    link: Annotated[str, msgspec.Meta(description="Result URL")]
+    snippet: Annotated[str, msgspec.Meta(description="Result snippet")]
+    display_link: Annotated[str, msgspec.Meta(description="Display URL")]
 
 
-class SearchResponse(BaseModel):
+class SearchResponse(msgspec.Struct, frozen=True):
     """Response from Google Custom Search."""
 
-    results: list[SearchResult] = Field(..., description="Search results")
-    total_results: int = Field(..., description="Total number of results found")
-    search_time: float = Field(..., description="Search time in seconds")
+    results: Annotated[list[SearchResult], msgspec.Meta(description="Search results")]
+    total_results: Annotated[
+        int, msgspec.Meta(description="Total number of results found")
+    ]
+    search_time: Annotated[float, msgspec.Meta(description="Search time in seconds")]
+
+
+def _struct_schema(struct: type[msgspec.Struct]) -> dict[str, Any]:
+    """Build an inline JSON schema for a msgspec struct."""
+    _, components = msgspec.json.schema_components(
+        [struct], ref_template="#/$defs/{name}"
+    )
+    schema: dict[str, Any] = components.pop(struct.__name__)
+    if components:
+        schema["$defs"] = components
+    return schema
+
+
+class TransientHTTPError(aiohttp.ClientResponseError):
+    """Retryable HTTP error response (rate limited or server side failure)."""
 
 
 class GoogleSearchManager:
@@ -49,77 +121,222 @@ class GoogleSearchManager:
     def __init__(self, search_engine_id: str, credentials: Any):
         """Initialize with search engine ID and credentials."""
         self.search_engine_id = search_engine_id
-        self.service = build("customsearch", "v1", credentials=credentials)
-        self._cache: dict[str, SearchResponse] = {}  # Simple cache for search results
-
-    def search(self, query: str, num_results: int = 10) -> SearchResponse:
+        self.credentials = credentials
+        # Query parameters shared by every request
+        self._base_params: dict[str, str | int] = {"cx": search_engine_id}
+        # Token refreshes reuse a keep-alive session that retries transient errors
+        self._auth_session = requests.Session()
+        self._auth_session.mount(
+            "https://",
+            HTTPAdapter(
+                max_retries=Retry(
+                    total=3,
+                    backoff_factor=0.2,
+                    status_forcelist=[429, 500, 502, 503, 504],
+                    allowed_methods=None,  # Token requests are POSTs
+                )
+            ),
+        )
+        self._auth_request = google.auth.transport.requests.Request(self._auth_session)  # type: ignore[no-untyped-call]
+        self._token_lock = asyncio.Lock()
+        self._request_semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        self._session: aiohttp.ClientSession | None = None
+        # Bounded LRU cache of search results whose entries expire after a TTL
+        self._cache: cachetools.TTLCache[_CacheKey, SearchResponse] = (
+            cachetools.TTLCache(maxsize=CACHE_MAX_SIZE, ttl=CACHE_TTL_SECONDS)
+        )
+        # Searches currently awaiting a response, shared by identical requests
+        self._inflight: dict[_CacheKey, asyncio.Task[SearchResponse]] = {}
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Return the shared HTTP session, creating it on first use."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=100, limit_per_host=20, ttl_dns_cache=300, keepalive_timeout=75
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=REQUEST_TIMEOUT
+            )
+        return self._session
+
+    def _token_expiring(self) -> bool:
+        """Check whether the access token is missing or about to expire."""
+        expiry = self.credentials.expiry
+        if not self.credentials.token or expiry is None:
+            return True
+        # google-auth stores expiry as a naive UTC datetime
+        now = datetime.now(UTC).replace(tzinfo=None)
+        return bool(expiry - now < TOKEN_REFRESH_MARGIN)
+
+    async def _get_access_token(self) -> str:
+        """Return a valid OAuth access token, refreshing it when needed."""
+        if self._token_expiring():
+            async with self._token_lock:
+                # Another task may have refreshed while we waited for the lock
+                if self._token_expiring():
+                    await asyncio.to_thread(
+                        self.credentials.refresh, self._auth_request
+                    )
+        return str(self.credentials.token)
+
+    async def search(self, query: str, num_results: int = 10) -> SearchResponse:
         """Perform a search using the Google Custom Search API."""
         # Check cache first
-        cache_key = f"{query}:{num_results}"
-        if cache_key in self._cache:
-            return self._cache[cache_key]
-            # Execute search
-        result = (
-            self.service.cse()
-            .list(
-                q=query,
-                cx=self.search_engine_id,
-                num=min(num_results, 10),  # Google API max per request is 10
+        cache_key: _CacheKey = (query, num_results)
+        cached: SearchResponse | None = self._cache.get(cache_key)
+        if cached is not None:
+            return cached
+        # Join an identical search that is already in flight, or start one.
+        # The fetch runs as its own task so cancelling one caller never
+        # cancels the request other callers are waiting on.
+        task = self._inflight.get(cache_key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(query, num_results))
+            self._inflight[cache_key] = task
+            task.add_done_callback(functools.partial(self._settle, cache_key))
+        return await asyncio.shield(task)
+
+    def _settle(self, cache_key: _CacheKey, task: asyncio.Task[SearchResponse]) -> None:
+        """Cache a finished search and drop it from the in-flight map."""
+        del self._inflight[cache_key]
+        # Retrieving the exception also keeps asyncio from logging it
+        if not task.cancelled() and task.exception() is None:
+            self._cache[cache_key] = task.result()
+
+    async def _fetch(self, query: str, num_results: int) -> SearchResponse:
+        """Fetch search results, requesting all result pages concurrently."""
+        token = await self._get_access_token()
+        headers = {"Authorization": f"Bearer {token}"}
+        if num_results <= MAX_RESULTS_PER_PAGE:
+            # Common case: a single page, no need to fan out
+            pages = [await self._fetch_page(query, headers, 1, num_results)]
+        else:
+            pages = await asyncio.gather(
+                *(
+                    self._fetch_page(
+                        query,
+                        headers,
+                        start,
+                        min(MAX_RESULTS_PER_PAGE, num_results - start + 1),
+                    )
+                    for start in range(1, num_results + 1, MAX_RESULTS_PER_PAGE)
+                )
             )
-            .execute()
-        )
 
-        results = []
-        for item in result.get("items", []):
-            results.append(
-                SearchResult(
-                    title=item.get("title", ""),
-                    link=item.get("link", ""),
-                    snippet=item.get("snippet", ""),
-                    display_link=item.get("displayLink", ""),
-                )
+        results = [
+            SearchResult(
+                title=item.get("title", ""),
+                link=item.get("link", ""),
+                snippet=item.get("snippet", ""),
+                display_link=item.get("displayLink", ""),
             )
-            response = SearchResponse(
-                results=results,
-                total_results=int(
-                    result.get("searchInformation", {}).get("totalResults", 0)
-                ),
-                search_time=float(
-                    result.get("searchInformation", {}).get("searchTime", 0)
-                ),
+            for page in pages
+            for item in page.get("items") or ()
+        ]
+        search_info = pages[0].get("searchInformation") or _EMPTY
+        return SearchResponse(
+            results=results,
+            total_results=int(search_info.get("totalResults", 0)),
+            search_time=float(search_info.get("searchTime", 0.0)),
+        )
+
+    @tenacity.retry(
+        retry=tenacity.retry_if_exception_type(
+            (
+                aiohttp.ClientConnectionError,
+                aiohttp.ClientPayloadError,
+                TimeoutError,
+                TransientHTTPError,
             )
-            # Cache the result
-        self._cache[cache_key] = response
-        return response
+        ),
+        wait=tenacity.wait_exponential_jitter(multiplier=0.2, max=5),
+        stop=tenacity.stop_after_attempt(4),
+        reraise=True,
+    )
+    async def _fetch_page(
+        self, query: str, headers: dict[str, str], start: int, num: int
+    ) -> dict[str, Any]:
+        """Fetch a single page of results starting at the given 1-based index."""
+        params = {**self._base_params, "q": query, "num": num, "start": start}
+        async with self._request_semaphore:
+            async with self._get_session().get(
+                CSE_ENDPOINT, params=params, headers=headers
+            ) as resp:
+                # Quota exceeded and server errors are retried with backoff
+                if resp.status == 429 or resp.status >= 500:
+                    raise TransientHTTPError(
+                        resp.request_info,
+                        resp.history,
+                        status=resp.status,
+                        message=resp.reason or "",
+                        headers=resp.headers,
+                    )
+                resp.raise_for_status()
+                page: dict[str, Any] = await resp.json(loads=orjson.loads)
+        return page
 
     def clear_cache(self) -> None:
         """Clear the search results cache."""
         self._cache.clear()
 
+    async def close(self) -> None:
+        """Close the shared HTTP sessions."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        self._auth_session.close()
+
 
 # Global manager instance
 google_search_manager: GoogleSearchManager | None = None
 
 
+@dataclass(frozen=True, slots=True)
+class Config:
+    """Search engine and service account settings read from environment."""
+
+    search_engine_id: str | None
+    service_account_file: str | None
+    service_account_base64: str | None = field(repr=False)
+
+
+@functools.cache
+def _load_config() -> Config:
+    """Load configuration from environment once per process."""
+    return Config(
+        search_engine_id=os.getenv("GOOGLE_SEARCH_ENGINE_ID"),
+        service_account_file=os.getenv("GOOGLE_SERVICE_ACCOUNT_FILE"),
+        service_account_base64=os.getenv("GOOGLE_SERVICE_ACCOUNT_BASE64"),
+    )
+
+
 def get_google_search_manager() -> GoogleSearchManager:
     """Get or create GoogleSearchManager instance."""
     global google_search_manager
     if google_search_manager is None:
         # Get configuration from environment
-        search_engine_id = os.getenv("GOOGLE_SEARCH_ENGINE_ID")
+        search_engine_id = _load_config().search_engine_id
         if not search_engine_id:
             raise ValueError("GOOGLE_SEARCH_ENGINE_ID environment variable is required")
-            # Get credentials
+        # Get credentials
         credentials = get_google_credentials()
         # Create manager
         google_search_manager = GoogleSearchManager(search_engine_id, credentials)
     return google_search_manager
 
 
+@functools.lru_cache(maxsize=1)
+def _decode_service_account_info(service_account_base64: str) -> dict[str, Any]:
+    """Decode a base64 encoded service account JSON document."""
+    return orjson.loads(base64.b64decode(service_account_base64))  # type: ignore[no-any-return]
+
+
+@functools.lru_cache(maxsize=1)
 def get_google_credentials() -> service_account.Credentials:
     """Get Google service account credentials from environment."""
-    service_account_file = os.getenv("GOOGLE_SERVICE_ACCOUNT_FILE")
-    service_account_base64 = os.getenv("GOOGLE_SERVICE_ACCOUNT_BASE64")
+    config = _load_config()
+    service_account_file = config.service_account_file
+    service_account_base64 = config.service_account_base64
     if not service_account_file and not service_account_base64:
         raise ValueError(
             "Either GOOGLE_SERVICE_ACCOUNT_FILE or GOOGLE_SERVICE_ACCOUNT_BASE64 "
@@ -128,9 +345,7 @@ def get_google_credentials() -> service_account.Credentials:
     # Handle base64 encoded service account (for CI/CD)
     if service_account_base64:
         try:
-            service_account_info = json.loads(
-                base64.b64decode(service_account_base64).decode("utf-8")
-            )
+            service_account_info = _decode_service_account_info(service_account_base64)
             credentials = service_account.Credentials.from_service_account_info(  # type: ignore[no-untyped-call]
                 service_account_info, scopes=["https://www.googleapis.com/auth/cse"]
             )
@@ -138,85 +353,30 @@ def get_google_credentials() -> service_account.Credentials:
             raise ValueError(f"Invalid base64 encoded service account: {e}") from e
     # Handle file path (for local development)
     elif service_account_file:
-        if not os.path.exists(service_account_file):
-            raise ValueError(f"Service account file not found: {service_account_file}")
-        credentials = service_account.Credentials.from_service_account_file(  # type: ignore[no-untyped-call]
-            service_account_file, scopes=["https://www.googleapis.com/auth/cse"]
-        )
-    return credentials  # type: ignore[no-any-return]
-
-
-def get_google_service() -> Any:
-    """Create and return Google Custom Search service with service account auth."""
-    service_account_file = os.getenv("GOOGLE_SERVICE_ACCOUNT_FILE")
-    service_account_base64 = os.getenv("GOOGLE_SERVICE_ACCOUNT_BASE64")
-    search_engine_id = os.getenv("GOOGLE_SEARCH_ENGINE_ID")
-    if not search_engine_id:
-        raise ValueError("GOOGLE_SEARCH_ENGINE_ID environment variable is required")
-    if not service_account_file and not service_account_base64:
-        raise ValueError(
-            "Either GOOGLE_SERVICE_ACCOUNT_FILE or GOOGLE_SERVICE_ACCOUNT_BASE64 "
-            "environment variable is required"
-        )
-    # Handle base64 encoded service account (for CI/CD)
-    if service_account_base64:
         try:
-            service_account_info = json.loads(
-                base64.b64decode(service_account_base64).decode("utf-8")
+            credentials = service_account.Credentials.from_service_account_file(  # type: ignore[no-untyped-call]
+                service_account_file, scopes=["https://www.googleapis.com/auth/cse"]
             )
-            credentials = service_account.Credentials.from_service_account_info(  # type: ignore[no-untyped-call]
-                service_account_info, scopes=["https://www.googleapis.com/auth/cse"]
-            )
-        except (ValueError, binascii.Error) as e:
-            raise ValueError(f"Invalid base64 encoded service account: {e}") from e
-    # Handle file path (for local development)
-    elif service_account_file:
-        if not os.path.exists(service_account_file):
-            raise ValueError(f"Service account file not found: {service_account_file}")
-        credentials = service_account.Credentials.from_service_account_file(  # type: ignore[no-untyped-call]
-            service_account_file, scopes=["https://www.googleapis.com/auth/cse"]
-        )
-    # Build the Custom Search service
-    service = build("customsearch", "v1", credentials=credentials)
-    return service
+        except FileNotFoundError as e:
+            raise ValueError(
+                f"Service account file not found: {service_account_file}"
+            ) from e
+    return credentials  # type: ignore[no-any-return]
 
 
-def search_google_custom_search(query: str, num_results: int = 10) -> SearchResponse:
+async def search_google_custom_search(
+    query: str, num_results: int = 10
+) -> SearchResponse:
     """Perform Google Custom Search with service account authentication."""
-    search_engine_id = os.getenv("GOOGLE_SEARCH_ENGINE_ID")
-    service = get_google_service()
-    # Execute search
-    result = (
-        service.cse()
-        .list(
-            q=query,
-            cx=search_engine_id,
-            num=min(num_results, 10),  # Google API max per request is 10
-        )
-        .execute()
-    )
-    results = []
-    for item in result.get("items", []):
-        results.append(
-            SearchResult(
-                title=item.get("title", ""),
-                link=item.get("link", ""),
-                snippet=item.get("snippet", ""),
-                display_link=item.get("displayLink", ""),
-            )
-        )
-    return SearchResponse(
-        results=results,
-        total_results=int(result.get("searchInformation", {}).get("totalResults", 0)),
-        search_time=float(result.get("searchInformation", {}).get("searchTime", 0)),
-    )
+    return await get_google_search_manager().search(query, num_results)
 
 
-@mcp.tool()
-async def google_search(params: SearchParams) -> SearchResponse:
+@mcp.tool(output_schema=_struct_schema(SearchResponse))
+async def google_search(params: SearchParams) -> dict[str, Any]:
     """Search the web using Google Custom Search API and return structured results."""
     manager = get_google_search_manager()
-    return manager.search(params.query, params.num_results or 10)
+    response = await manager.search(params.query, params.num_results)
+    return msgspec.to_builtins(response)  # type: ignore[no-any-return]
 
 
 class ClearCacheResponse(BaseModel):
@@ -234,6 +394,17 @@ async def clear_search_cache() -> ClearCacheResponse:
     return ClearCacheResponse(success=True, message="Search cache cleared")
 
 
+async def run_server(
+    transport: Literal["stdio", "http"], **transport_kwargs: Any
+) -> None:
+    """Run the MCP server and release the shared HTTP session on shutdown."""
+    try:
+        await mcp.run_async(transport, **transport_kwargs)
+    finally:
+        if google_search_manager is not None:
+            await google_search_manager.close()
+
+
 def main() -> None:
     """Run the MCP server."""
     # Parse command line arguments
@@ -253,9 +424,10 @@ def main() -> None:
     args = parser.parse_args()
 
     # Validate required environment variables
-    search_engine_id = os.getenv("GOOGLE_SEARCH_ENGINE_ID")
-    service_account_file = os.getenv("GOOGLE_SERVICE_ACCOUNT_FILE")
-    service_account_base64 = os.getenv("GOOGLE_SERVICE_ACCOUNT_BASE64")
+    config = _load_config()
+    search_engine_id = config.search_engine_id
+    service_account_file = config.service_account_file
+    service_account_base64 = config.service_account_base64
     if not search_engine_id:
         print("Error: GOOGLE_SEARCH_ENGINE_ID environment variable is required")
         print("Example: GOOGLE_SEARCH_ENGINE_ID=your-search-engine-id")
@@ -268,17 +440,24 @@ def main() -> None:
         return
     auth_type = "file-based" if service_account_file else "base64-encoded"
 
+    # Load credentials at startup so the first search does not pay for it
+    try:
+        get_google_search_manager()
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+
     if args.transport == "http":
         print(
             f"Starting Google Custom Search MCP Server with {auth_type} authentication"
         )
         print(f"Server running on http://{args.host}:{args.port}")
-        mcp.run(transport="http", host=args.host, port=args.port)
+        asyncio.run(run_server("http", host=args.host, port=args.port))
     else:
         print(
             f"Starting Google Custom Search MCP Server with {auth_type} authentication in STDIO mode"
         )
-        mcp.run()
+        asyncio.run(run_server("stdio"))
 
 
 if __name__ == "__main__":
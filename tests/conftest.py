@@ -4,10 +4,16 @@ import os
 
 import pytest
 
+import server
+
 
 @pytest.fixture(autouse=True)
-def ensure_test_env():
-    """Automatically use this fixture for all tests to ensure required env vars."""
+def ensure_test_env(request):
+    """Skip tests marked as live unless the required env vars are set."""
+    if request.node.get_closest_marker("live") is None:
+        yield
+        return
+
     # Check if we have the required environment variables for live testing
     required_vars = ["GOOGLE_SERVICE_ACCOUNT_BASE64", "GOOGLE_SEARCH_ENGINE_ID"]
     missing_vars = [var for var in required_vars if not os.getenv(var)]
@@ -18,3 +24,11 @@ def ensure_test_env():
         )
 
     yield
+
+
+@pytest.fixture(autouse=True)
+async def close_search_session():
+    """Close the shared HTTP session so it never outlives a test's event loop."""
+    yield
+    if server.google_search_manager is not None:
+        await server.google_search_manager.close()
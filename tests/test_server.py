@@ -1,16 +1,26 @@
 """Live integration tests for Google Custom Search MCP server."""
 
+import asyncio
+from datetime import UTC, datetime, timedelta
+
+import aiohttp
 import pytest
+import tenacity
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from fastmcp import Client
 
+import server
 from server import SearchParams, SearchResponse, search_google_custom_search
 
 
 class TestSearchGoogleCustomSearch:
     """Live integration tests with actual Google Custom Search API."""
 
-    def test_search_success(self):
+    @pytest.mark.live
+    async def test_search_success(self):
         """Test successful search operation with live Google API."""
-        result = search_google_custom_search("python programming", 5)
+        result = await search_google_custom_search("python programming", 5)
 
         assert isinstance(result, SearchResponse)
         assert len(result.results) <= 5  # May get fewer results
@@ -25,16 +35,25 @@ class TestSearchGoogleCustomSearch:
             assert first_result.snippet
             assert first_result.display_link
 
-    def test_search_no_results_query(self):
+    @pytest.mark.live
+    async def test_search_no_results_query(self):
         """Test search with a query that should return no results."""
         # Use a very specific query that likely returns no results
-        result = search_google_custom_search("asdfghjkl1234567890zzzqqq", 5)
+        result = await search_google_custom_search("asdfghjkl1234567890zzzqqq", 5)
 
         assert isinstance(result, SearchResponse)
         assert len(result.results) == 0
         assert result.total_results == 0
         assert result.search_time >= 0
 
+    @pytest.mark.live
+    async def test_search_paginates_beyond_ten_results(self):
+        """Test that more than ten results are fetched across result pages."""
+        result = await search_google_custom_search("python programming", 15)
+
+        assert isinstance(result, SearchResponse)
+        assert 10 < len(result.results) <= 15
+
     def test_search_params_validation(self):
         """Test SearchParams validation."""
         params = SearchParams(query="test", num_results=5)
@@ -46,6 +65,11 @@ class TestSearchGoogleCustomSearch:
         params = SearchParams(query="test")
         assert params.num_results == 10
 
+    def test_null_num_results_uses_default(self):
+        """Test that an explicit null number of results falls back to the default."""
+        params = SearchParams(query="test", num_results=None)
+        assert params.num_results == 10
+
     def test_num_results_validation(self):
         """Test number of results validation."""
         # Test minimum
@@ -70,3 +94,191 @@ class TestMCPIntegration:
         assert google_search.name == "google_search"
         assert hasattr(google_search, "description")
         assert "Google Custom Search" in google_search.description
+
+    async def test_null_num_results_through_tool(self, cse, monkeypatch):
+        """Test that the google_search tool accepts a null number of results."""
+        manager, fake = cse
+        monkeypatch.setattr(server, "google_search_manager", manager)
+
+        async with Client(server.mcp) as client:
+            result = await client.call_tool(
+                "google_search", {"params": {"query": "y", "num_results": None}}
+            )
+
+        assert len(result.structured_content["results"]) == 10
+        assert [(start, num) for _, start, num in fake.calls] == [(1, 10)]
+
+
+class TestGoogleCredentials:
+    """Test loading service account credentials from environment."""
+
+    def test_missing_service_account_file(self, monkeypatch, tmp_path):
+        """Test that a missing service account file raises ValueError."""
+        missing = tmp_path / "missing.json"
+        monkeypatch.delenv("GOOGLE_SERVICE_ACCOUNT_BASE64", raising=False)
+        monkeypatch.setenv("GOOGLE_SERVICE_ACCOUNT_FILE", str(missing))
+        server._load_config.cache_clear()
+        server.get_google_credentials.cache_clear()
+        try:
+            with pytest.raises(ValueError, match="Service account file not found"):
+                server.get_google_credentials()
+        finally:
+            server._load_config.cache_clear()
+            server.get_google_credentials.cache_clear()
+
+
+class FakeCredentials:
+    """Credentials stand-in holding an access token that never expires."""
+
+    token = "test-token"
+    expiry = datetime.now(UTC).replace(tzinfo=None) + timedelta(days=1)
+
+
+class FakeCSE:
+    """Local Custom Search stand-in that records every page request."""
+
+    def __init__(self):
+        self.statuses: list[int] = []  # Served, in order, before any results
+        self.calls: list[tuple[str, int, int]] = []  # (q, start, num) per request
+        self.delay = 0.0
+
+    async def handler(self, request):
+        query = request.query["q"]
+        start = int(request.query["start"])
+        num = int(request.query["num"])
+        self.calls.append((query, start, num))
+        await asyncio.sleep(self.delay)
+        if self.statuses:
+            return web.Response(status=self.statuses.pop(0))
+        items = [
+            {
+                "title": f"Result {i}",
+                "link": f"https://example.com/{i}",
+                "snippet": "Example snippet",
+                "displayLink": "example.com",
+            }
+            for i in range(start, start + num)
+        ]
+        return web.json_response(
+            {
+                "items": items,
+                "searchInformation": {"totalResults": "100", "searchTime": 0.1},
+            }
+        )
+
+
+@pytest.fixture
+async def cse(monkeypatch):
+    """Point a GoogleSearchManager at a local Custom Search stand-in."""
+    fake = FakeCSE()
+    app = web.Application()
+    app.router.add_get("/customsearch/v1", fake.handler)
+    async with TestServer(app) as test_server:
+        monkeypatch.setattr(
+            server, "CSE_ENDPOINT", str(test_server.make_url("/customsearch/v1"))
+        )
+        monkeypatch.setattr(
+            server.GoogleSearchManager._fetch_page.retry,
+            "wait",
+            tenacity.wait_none(),
+        )
+        manager = server.GoogleSearchManager("test-cx", FakeCredentials())
+        yield manager, fake
+        await manager.close()
+
+
+class TestPagination:
+    """Test splitting searches into Custom Search result pages."""
+
+    async def test_single_page_request(self, cse):
+        """Test that ten or fewer results are fetched with one request."""
+        manager, fake = cse
+
+        result = await manager.search("one page", 7)
+
+        assert [(start, num) for _, start, num in fake.calls] == [(1, 7)]
+        assert len(result.results) == 7
+
+    async def test_pages_split_and_keep_order(self, cse):
+        """Test that 25 results are fetched as three pages in result order."""
+        manager, fake = cse
+
+        result = await manager.search("many pages", 25)
+
+        pages = sorted((start, num) for _, start, num in fake.calls)
+        assert pages == [(1, 10), (11, 10), (21, 5)]
+        assert [r.link for r in result.results] == [
+            f"https://example.com/{i}" for i in range(1, 26)
+        ]
+
+
+class TestInflightCoalescing:
+    """Test that concurrent identical searches share one API call."""
+
+    async def test_concurrent_identical_searches_share_one_call(self, cse):
+        """Test that N concurrent identical searches make one HTTP call."""
+        manager, fake = cse
+        fake.delay = 0.05
+
+        results = await asyncio.gather(*(manager.search("shared", 5) for _ in range(5)))
+
+        assert len(fake.calls) == 1
+        assert all(result is results[0] for result in results)
+
+    async def test_cancelling_one_caller_does_not_cancel_others(self, cse):
+        """Test that cancelling the first caller leaves the others running."""
+        manager, fake = cse
+        fake.delay = 0.1
+
+        leader = asyncio.create_task(manager.search("shared", 5))
+        follower = asyncio.create_task(manager.search("shared", 5))
+        await asyncio.sleep(0.02)
+        leader.cancel()
+
+        result = await follower
+
+        assert leader.cancelled()
+        assert len(result.results) == 5
+        assert len(fake.calls) == 1
+        # The shared request still completed and was cached
+        assert await manager.search("shared", 5) is result
+        assert len(fake.calls) == 1
+
+
+class TestCustomSearchRetries:
+    """Test retry handling against a local Custom Search stand-in."""
+
+    async def test_retries_transient_errors(self, cse):
+        """Test that 429 and 5xx responses are retried until success."""
+        manager, fake = cse
+        fake.statuses.extend([429, 503])
+
+        result = await manager.search("retry me", 1)
+
+        assert len(fake.calls) == 3
+        assert result.results[0].link == "https://example.com/1"
+
+    async def test_client_errors_are_not_retried(self, cse):
+        """Test that other 4xx responses fail without retrying."""
+        manager, fake = cse
+        fake.statuses.append(400)
+
+        with pytest.raises(aiohttp.ClientResponseError) as exc_info:
+            await manager.search("bad request", 1)
+
+        assert exc_info.value.status == 400
+        assert not isinstance(exc_info.value, server.TransientHTTPError)
+        assert len(fake.calls) == 1
+
+    async def test_timeouts_are_retried_then_raised(self, cse, monkeypatch):
+        """Test that stalled requests time out and are retried a bounded number of times."""
+        manager, fake = cse
+        monkeypatch.setattr(
+            server, "REQUEST_TIMEOUT", aiohttp.ClientTimeout(total=0.05)
+        )
+        fake.delay = 0.5
+
+        with pytest.raises(TimeoutError):
+            await manager.search("stalled", 1)
+
+        assert len(fake.calls) == 4